@@ -1,20 +1,92 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from contextlib import contextmanager
 from astral import LocationInfo
-from astral.sun import sun
-from datetime import datetime, timedelta
+from astral import refraction_at_zenith
+from astral.sun import sunrise, sunset, SUN_APPARENT_RADIUS
+from datetime import datetime, date, timedelta
+import numpy as np
 import pytz
 import json
+import math
 import traceback
+import bisect
+import heapq
+import queue
+import time
+import threading
+import multiprocessing
+import click
+import csv
+import io
 import os
 
 app = Flask(__name__)
 CORS(app)
 
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
 # Load countries.json once at startup
-with open("countries.json", "r", encoding="utf-8") as f:
+with open(os.path.join(BASE_DIR, "countries.json"), "r", encoding="utf-8") as f:
     country_data = json.load(f)
 
+
+# Location registry, built once: requests resolve (country, state) with a
+# single dict lookup and get a prebuilt timezone and astral observer back.
+def normalize_name(name):
+    return " ".join(str(name or "").replace("_", " ").replace("-", " ").split()).casefold()
+
+
+def build_registry(countries):
+    places = {}          # (country, state) normalized -> place
+    country_names = {}   # normalized country name/alias -> canonical name
+    for c in countries:
+        country_keys = [normalize_name(n) for n in [c["country"]] + c.get("aliases", [])]
+        for ck in country_keys:
+            country_names[ck] = c["country"]
+        for match in c["locations"]:
+            place = {
+                "key": (c["country"], match["state"]),
+                "country": c["country"],
+                "state": match["state"],
+                "timezone": match["timezone"],
+                "tz": pytz.timezone(match["timezone"]),
+                "observer": LocationInfo(match["state"], c["country"], match["timezone"],
+                                         match["latitude"], match["longitude"]).observer,
+            }
+            for name in [match["state"]] + match.get("aliases", []):
+                for ck in country_keys:
+                    places[(ck, normalize_name(name))] = place
+    return places, country_names
+
+
+places, country_names = build_registry(country_data)
+
+
+def find_place(country, state):
+    return places.get((normalize_name(country), normalize_name(state)))
+
+
+def resolve_place(country, state):
+    # (place, None), or (None, error response) for an unknown country (400)
+    # or an unknown state/city within a known one (404)
+    place = find_place(country, state)
+    if place:
+        return place, None
+    if normalize_name(country) not in country_names:
+        return None, (jsonify({"error": f"Country '{country}' not found"}), 400)
+    return None, (jsonify({"error": f"State/City '{state}' not found in {country}"}), 404)
+
+
+def all_places():
+    # Each place once, in countries.json order (aliases share the same dict)
+    return list({id(p): p for p in places.values()}.values())
+
+
+places_by_key = {p["key"]: p for p in all_places()}
+
 # Planet ruling each hour of the day
 dayHours = {
     "Sunday":    ["Sun", "Venus", "Mercury", "Moon", "Saturn", "Jupiter", "Mars", "Sun", "Venus", "Mercury", "Moon", "Saturn"],
@@ -37,101 +109,724 @@ nightHours = {
     "Saturday":  dayHours["Tuesday"]
 }
 
+# Interned codes for the compact hour-block table: planets, periods and
+# weekdays (date.weekday() order) are stored as indices into these lists.
+PLANETS = ["Sun", "Moon", "Mars", "Mercury", "Jupiter", "Venus", "Saturn"]
+PERIODS = ["Night", "Day"]
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+# ----- METRICS -----
+# Optional per-stage timers for /sun-times, exported by /metrics in the
+# Prometheus text format. Off unless METRICS_ENABLED=1, since even
+# perf_counter calls add up on the cached path. Stages never nest, so their
+# sums add up to the request time (less routing and cache bookkeeping):
+#   now        datetime.now in the location's timezone
+#   sun        astral sunrise/sunset for dates missing from the ephemeris
+#   blocks     building the hour table from cached sun events
+#   serialize  rendering a cacheable body (default or columnar)
+#   validity   computing when the cached body expires (local midnight)
+#   splice     putting the current time into the cached body
+# "request" is the whole view and is exported as its own metric.
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED") == "1"
+
+stage_seconds = {}   # stage -> [count, total seconds]
+counters = {}        # (metric, label value) -> count
+metrics_lock = threading.Lock()
+
+
+@contextmanager
+def timed(stage):
+    if not METRICS_ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        with metrics_lock:
+            totals = stage_seconds.setdefault(stage, [0, 0.0])
+            totals[0] += 1
+            totals[1] += elapsed
+
+
+def count(metric, label):
+    if METRICS_ENABLED:
+        with metrics_lock:
+            counters[(metric, label)] = counters.get((metric, label), 0) + 1
+
+
+# Sunrise/sunset cache: one astral computation per (location, local date).
+# A request for "today" needs dates today-3 .. today+8 (nights span two days).
+EPHEMERIS_DAYS_BEFORE = 3
+EPHEMERIS_DAYS_AFTER = 8
+
+ephemeris_cache = {}   # location key -> {date: (sunrise, sunset)}
+ephemeris_today = {}   # location key -> local date the window was last rolled to
+ephemeris_lock = threading.Lock()
+
+
+def get_sun_events(place, date):
+    key = place["key"]
+    days = ephemeris_cache.get(key)
+    events = days.get(date) if days else None
+    if events is None:
+        with timed("sun"):
+            try:
+                events = (sunrise(place["observer"], date, place["tz"]),
+                          sunset(place["observer"], date, place["tz"]))
+            except ValueError:
+                # astral gives up on events within a minute of 00:00 UTC (e.g.
+                # 05:30 IST sunrises); the batch solver handles those.
+                rise, set_ = sun_events_batch([place], [date])
+                events = (datetime.fromtimestamp(rise[0, 0], place["tz"]),
+                          datetime.fromtimestamp(set_[0, 0], place["tz"]))
+        with ephemeris_lock:
+            ephemeris_cache.setdefault(key, {})[date] = events
+    return events
+
+
+def roll_ephemeris(place, today):
+    # Once local midnight passes, drop dates that fell out of the window
+    # and compute the new day at the far end.
+    key = place["key"]
+    if ephemeris_today.get(key) == today:
+        return
+    oldest = today - timedelta(days=EPHEMERIS_DAYS_BEFORE)
+    with ephemeris_lock:
+        days = ephemeris_cache.get(key, {})
+        ephemeris_cache[key] = {d: ev for d, ev in days.items() if d >= oldest}
+        ephemeris_today[key] = today
+    for offset in range(-EPHEMERIS_DAYS_BEFORE, EPHEMERIS_DAYS_AFTER + 1):
+        get_sun_events(place, today + timedelta(days=offset))
+
+
+# Serialized /sun-times bodies per location. Everything except "time" stays
+# the same until the current hour block ends (or local midnight shifts the
+# 11-day window), so the body is cached with "time" left as a splice point.
+TIME_SLOT = "\x00time\x00"
+
+response_cache = {}   # location key -> {"table", "prefix", "suffix", "columnar", "valid_from", "valid_until"}
+response_cache_lock = threading.Lock()
+
+
+# Precomputed strings for the fast serializer: every "HH:MM" of the day and
+# the JSON-quoted form of each interned code.
+HHMM = ["%02d:%02d" % (h, m) for h in range(24) for m in range(60)]
+PLANET_JSON = [json.dumps(p) for p in PLANETS]
+PERIOD_JSON = [json.dumps(p) for p in PERIODS]
+WEEKDAY_JSON = [json.dumps(w) for w in WEEKDAYS]
+NIGHT_PLANET_CODES = [[PLANETS.index(p) for p in nightHours[w]] for w in WEEKDAYS]
+DAY_PLANET_CODES = [[PLANETS.index(p) for p in dayHours[w]] for w in WEEKDAYS]
+BLOCK_JSON = '{"date":"%s","day_name":%s,"end":"%s","hour":%d,"is_current":%s,"period":%s,"planet":%s,"start":"%s"}'
+
+EPOCH = datetime(1970, 1, 1, tzinfo=pytz.utc)
+MICROSECOND = timedelta(microseconds=1)
+MINUTE_US = 60 * 1000000
+
+
+def wall_clock_us(dt):
+    # Microseconds since local midnight, as shown by strftime
+    return ((dt.hour * 60 + dt.minute) * 60 + dt.second) * 1000000 + dt.microsecond
+
+
+def build_hour_table(place, now, day_offsets=range(-2, 9)):
+    # Struct-of-arrays form of the hour blocks for the local dates
+    # today + day_offsets (night, then day, 12 hours each); the default is
+    # the 264 blocks of /sun-times. Hour boundaries are period start + i/12
+    # of the period, kept as integer microsecond offsets so "HH:MM" is a
+    # table lookup instead of a datetime + strftime per block. start_us and
+    # end_us hold the same boundaries as epoch microseconds.
+    roll_ephemeris(place, now.date())
+    now_us = (now - EPOCH) // MICROSECOND
+    table = {"dates": [], "start": [], "end": [], "planet": [], "period": [], "date": [], "weekday": [],
+             "start_us": [], "end_us": [], "current": None, "current_end": None}
+
+    for offset in day_offsets:
+        block_date = now.date() + timedelta(days=offset)  # night belongs to the next day's date
+        _, night_start = get_sun_events(place, block_date - timedelta(days=1))
+        sunrise_, sunset_ = get_sun_events(place, block_date)
+        weekday = block_date.weekday()
+        date_code = len(table["dates"])
+        table["dates"].append(block_date.isoformat())
+
+        for period, period_start, period_end, planets in (
+                (0, night_start, sunrise_, NIGHT_PLANET_CODES[weekday]),
+                (1, sunrise_, sunset_, DAY_PLANET_CODES[weekday])):
+            hour_length = (period_end - period_start).total_seconds() / 12
+            # timedelta's own rounding, so boundaries match the old datetime math to the microsecond
+            bounds = [timedelta(seconds=i * hour_length) // MICROSECOND for i in range(13)]
+            wall = wall_clock_us(period_start)
+            labels = [HHMM[(wall + b) // MINUTE_US % 1440] for b in bounds]
+
+            first = len(table["start"])
+            table["start"].extend(labels[:12])
+            table["end"].extend(labels[1:])
+            table["planet"].extend(planets)
+            table["period"].extend([period] * 12)
+            table["date"].extend([date_code] * 12)
+            table["weekday"].extend([weekday] * 12)
+
+            start_us = (period_start - EPOCH) // MICROSECOND
+            table["start_us"].extend(start_us + b for b in bounds[:12])
+            table["end_us"].extend(start_us + b for b in bounds[1:])
+            if start_us <= now_us < (period_end - EPOCH) // MICROSECOND:
+                for i in range(12):
+                    if start_us + bounds[i] <= now_us < start_us + bounds[i + 1]:
+                        table["current"] = first + i
+                        table["current_end"] = period_start + timedelta(microseconds=bounds[i + 1])
+
+    return table
+
+
+def current_fields(table):
+    # (period, day_of_week, islamic_hour) of the current block, or Nones
+    i = table["current"]
+    if i is None:
+        return None, None, None
+    return PERIODS[table["period"][i]], WEEKDAYS[table["weekday"][i]], i % 12 + 1
+
+
+def serialize_table(table, now, timezone_name):
+    # Emits exactly what jsonify (sorted keys, compact separators) produced
+    # for the old list of block dicts, split around "time".
+    current = table["current"]
+    dates, start, end = table["dates"], table["start"], table["end"]
+    planet, period, date_, weekday = table["planet"], table["period"], table["date"], table["weekday"]
+    blocks = ",".join([
+        BLOCK_JSON % (dates[date_[i]], WEEKDAY_JSON[weekday[i]], end[i], i % 12 + 1,
+                      "true" if i == current else "false", PERIOD_JSON[period[i]], PLANET_JSON[planet[i]], start[i])
+        for i in range(len(start))
+    ])
+    current_period, current_weekday, current_hour = current_fields(table)
+    prefix = '{"date":"%s","day_of_week":%s,"hour_blocks":[%s],"islamic_hour":%s,"period":%s,"time":' % (
+        now.strftime("%Y-%m-%d"), json.dumps(current_weekday), blocks, json.dumps(current_hour),
+        json.dumps(current_period))
+    suffix = ',"timezone":%s}\n' % json.dumps(timezone_name)
+    return prefix, suffix
+
+
+def serialize_columnar(table, now, timezone_name):
+    # ?format=columnar: one array per field, with planet/period/date/day_name
+    # given as indices into the "codes" lists.
+    current_period, current_weekday, current_hour = current_fields(table)
+    body = app.json.dumps({
+        "date": now.strftime("%Y-%m-%d"),
+        "time": TIME_SLOT,
+        "timezone": timezone_name,
+        "period": current_period,
+        "day_of_week": current_weekday,
+        "islamic_hour": current_hour,
+        "current": table["current"],
+        "codes": {"planet": PLANETS, "period": PERIODS, "date": table["dates"], "day_name": WEEKDAYS},
+        "hour_blocks": {
+            "hour": [i % 12 + 1 for i in range(len(table["start"]))],
+            "start": table["start"],
+            "end": table["end"],
+            "planet": table["planet"],
+            "period": table["period"],
+            "date": table["date"],
+            "day_name": table["weekday"]
+        }
+    }, separators=(",", ":"))
+    prefix, suffix = body.split(app.json.dumps(TIME_SLOT))
+    return prefix, suffix + "\n"
+
+
+def build_response(place, now):
+    roll_ephemeris(place, now.date())  # "sun" is timed inside, not under "blocks"
+    with timed("blocks"):
+        table = build_hour_table(place, now)
+
+    with timed("serialize"):
+        prefix, suffix = serialize_table(table, now, place["timezone"])
+
+    # Valid until the current block ends or the local date changes,
+    # whichever comes first.
+    with timed("validity"):
+        midnight = place["tz"].localize(datetime.combine(now.date() + timedelta(days=1), datetime.min.time()))
+    current_end = table["current_end"]
+    valid_until = min(current_end, midnight) if current_end else midnight
+    return {"table": table, "prefix": prefix, "suffix": suffix, "columnar": None,
+            "valid_from": now, "valid_until": valid_until}
+
+
 @app.route('/sun-times', methods=['POST'])
 def get_sun_times():
     data = request.json
     requested_country = data.get("country")
     requested_state = data.get("state")
+    response_format = request.args.get("format", "json")
+    if response_format not in ("json", "columnar"):
+        return jsonify({"error": f"Unknown format '{response_format}', expected 'json' or 'columnar'"}), 400
+
+    place, error = resolve_place(requested_country, requested_state)
+    if error:
+        return error
 
-    country = next((c for c in country_data if c["country"].lower() == requested_country.lower()), None)
-    if not country:
-        return jsonify({"error": f"Country '{requested_country}' not found"}), 400
+    try:
+        with timed("request"):
+            with timed("now"):
+                now = datetime.now(place["tz"])
+            key = place["key"]
+
+            cached = response_cache.get(key)
+            if cached is None or not cached["valid_from"] <= now < cached["valid_until"]:
+                count("response_cache", "miss")
+                cached = build_response(place, now)
+                with response_cache_lock:
+                    response_cache[key] = cached
+            else:
+                count("response_cache", "hit")
+
+            prefix, suffix = cached["prefix"], cached["suffix"]
+            if response_format == "columnar":
+                if cached["columnar"] is None:
+                    with timed("serialize"):
+                        cached["columnar"] = serialize_columnar(cached["table"], cached["valid_from"], place["timezone"])
+                prefix, suffix = cached["columnar"]
 
-    match = next((loc for loc in country["locations"] if loc["state"].lower() == requested_state.lower()), None)
-    if not match:
-        return jsonify({"error": f"State/City '{requested_state}' not found in {requested_country}"}), 404
+            with timed("splice"):
+                body = prefix + '"' + now.strftime("%H:%M:%S") + '"' + suffix
+            return app.response_class(body, mimetype="application/json")
+
+    except Exception as e:
+        print("ERROR:", traceback.format_exc())
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    lines = [
+        "# HELP sun_times_stage_seconds Time spent in each /sun-times stage.",
+        "# TYPE sun_times_stage_seconds summary",
+    ]
+    with metrics_lock:
+        for stage, (n, total) in sorted(stage_seconds.items()):
+            if stage != "request":
+                lines.append(f'sun_times_stage_seconds_sum{{stage="{stage}"}} {total:.9f}')
+                lines.append(f'sun_times_stage_seconds_count{{stage="{stage}"}} {n}')
+        n, total = stage_seconds.get("request", (0, 0.0))
+        lines.append("# HELP sun_times_request_seconds Total /sun-times view time.")
+        lines.append("# TYPE sun_times_request_seconds summary")
+        lines.append(f"sun_times_request_seconds_sum {total:.9f}")
+        lines.append(f"sun_times_request_seconds_count {n}")
+        lines.append("# HELP sun_times_response_cache_total /sun-times response cache lookups.")
+        lines.append("# TYPE sun_times_response_cache_total counter")
+        for (metric, label), n in sorted(counters.items()):
+            lines.append(f'sun_times_{metric}_total{{result="{label}"}} {n}')
+    return Response("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
+
+
+# ----- CURRENT HOUR -----
+# Per-location hour table (same boundaries as /sun-times) covering the local
+# dates today-1 .. today+2, so "which block is now" is a bisect over its
+# sorted start_us rather than a scan of the full 264-block payload. Rebuilt
+# when the local date rolls over.
+hour_index = {}   # location key -> {"today", "table"}
+
+
+def find_current_hour(place, now):
+    # (hour table, index of the block containing the aware datetime now)
+    index = hour_index.get(place["key"])
+    if index is None or index["today"] != now.date():
+        index = {"today": now.date(), "table": build_hour_table(place, now, range(-1, 3))}
+        hour_index[place["key"]] = index
+    table = index["table"]
+    return table, bisect.bisect_right(table["start_us"], (now - EPOCH) // MICROSECOND) - 1
+
+
+def current_hour_payload(place, now):
+    table, i = find_current_hour(place, now)
+    return {
+        "period": PERIODS[table["period"][i]],
+        "day_of_week": WEEKDAYS[table["weekday"][i]],
+        "islamic_hour": i % 12 + 1,
+        "planet": PLANETS[table["planet"][i]],
+        "start": table["start"][i],
+        "end": table["end"][i],
+        "remaining_seconds": (table["end_us"][i] - (now - EPOCH) // MICROSECOND) // 1000000,
+        "next": {
+            "period": PERIODS[table["period"][i + 1]],
+            "day_of_week": WEEKDAYS[table["weekday"][i + 1]],
+            "islamic_hour": (i + 1) % 12 + 1,
+            "planet": PLANETS[table["planet"][i + 1]],
+            "start": table["start"][i + 1]
+        }
+    }
+
+
+@app.route('/current-hour', methods=['GET'])
+def get_current_hour():
+    requested_country = request.args.get("country")
+    requested_state = request.args.get("state")
+
+    place, error = resolve_place(requested_country, requested_state)
+    if error:
+        return error
 
     try:
-        tz = pytz.timezone(match["timezone"])
-        now = datetime.now(tz)
-        loc = LocationInfo(match["state"], requested_country, match["timezone"], match["latitude"], match["longitude"])
-
-        all_blocks = []
-        current_period = None
-        current_weekday = None
-        current_islamic_hour = None
-
-        for offset in range(-3, 8):
-            day = now + timedelta(days=offset)
-
-            # ----- NIGHT FIRST -----
-            night_start_data = sun(loc.observer, date=day.date(), tzinfo=tz)
-            night_end_data = sun(loc.observer, date=(day + timedelta(days=1)).date(), tzinfo=tz)
-            night_start = night_start_data["sunset"]
-            night_end = night_end_data["sunrise"]
-            night_weekday = (day + timedelta(days=1)).strftime('%A')  # Night belongs to next day
-            night_planets = nightHours[night_weekday]
-            total_night_seconds = (night_end - night_start).total_seconds()
-            hour_length_night = total_night_seconds / 12
-
-            for i in range(12):
-                hour_start = night_start + timedelta(seconds=i * hour_length_night)
-                hour_end = night_start + timedelta(seconds=(i + 1) * hour_length_night)
-                is_current = night_start <= now < night_end and hour_start <= now < hour_end
-
-                all_blocks.append({
-                    "hour": i + 1,
-                    "start": hour_start.strftime("%H:%M"),
-                    "end": hour_end.strftime("%H:%M"),
-                    "planet": night_planets[i],
-                    "period": "Night",
-                    "date": (day + timedelta(days=1)).strftime("%Y-%m-%d"),
-                    "day_name": night_weekday,
-                    "is_current": is_current
-                })
-
-                if is_current:
-                    current_period = "Night"
-                    current_weekday = night_weekday
-                    current_islamic_hour = i + 1
-
-            # ----- DAY NEXT -----
-            sunrise = night_end
-            sunset = night_end_data["sunset"]
-            day_weekday = (day + timedelta(days=1)).strftime('%A')
-            day_planets = dayHours[day_weekday]
-            total_day_seconds = (sunset - sunrise).total_seconds()
-            hour_length_day = total_day_seconds / 12
-
-            for i in range(12):
-                hour_start = sunrise + timedelta(seconds=i * hour_length_day)
-                hour_end = sunrise + timedelta(seconds=(i + 1) * hour_length_day)
-                is_current = sunrise <= now < sunset and hour_start <= now < hour_end
-
-                all_blocks.append({
-                    "hour": i + 1,
-                    "start": hour_start.strftime("%H:%M"),
-                    "end": hour_end.strftime("%H:%M"),
-                    "planet": day_planets[i],
-                    "period": "Day",
-                    "date": (day + timedelta(days=1)).strftime("%Y-%m-%d"),
-                    "day_name": day_weekday,
-                    "is_current": is_current
-                })
-
-                if is_current:
-                    current_period = "Day"
-                    current_weekday = day_weekday
-                    current_islamic_hour = i + 1
+        now = datetime.now(place["tz"])
+        return jsonify(current_hour_payload(place, now))
+
+    except Exception as e:
+        print("ERROR:", traceback.format_exc())
+        return jsonify({"error": str(e)}), 500
+
+
+# ----- TRANSITION EVENTS -----
+# Server-Sent Events per location. One scheduler thread keeps a heap of the
+# next hour boundary for every location with subscribers and, when one is
+# due, serializes the new /current-hour payload once and drops it into each
+# subscriber's queue. Connections just wait on their queue, so idle clients
+# cost no polling; under a cooperative (greenlet/async) worker they hold
+# no OS thread each.
+SSE_KEEPALIVE_SECONDS = 15
+SSE_RETRY_SECONDS = 60   # back-off before retrying a location whose event failed
+
+subscribers = {}        # location key -> set of queues
+transition_heap = []    # (boundary epoch microseconds, location key)
+scheduled = set()       # location keys currently in transition_heap
+last_fired = {}         # location key -> boundary most recently delivered
+scheduler_wakeup = threading.Condition()
+scheduler_thread = None
 
+
+def sse_event(place, now):
+    # Same bytes as the /current-hour body (sorted keys, compact separators)
+    return "event: hour\ndata: " + app.json.dumps(current_hour_payload(place, now), separators=(",", ":")) + "\n\n"
+
+
+def next_boundary(place, now):
+    # Epoch microseconds at which the block containing now ends
+    table, i = find_current_hour(place, now)
+    return table["start_us"][i + 1]
+
+
+def schedule_transition(key, boundary):
+    # Caller holds scheduler_wakeup. A subscriber computes its boundary before
+    # taking the lock, so it may race the scheduler firing that very boundary;
+    # skipping anything not after the last delivered one avoids a double event.
+    if key not in scheduled and subscribers.get(key) and boundary > last_fired.get(key, 0):
+        heapq.heappush(transition_heap, (boundary, key))
+        scheduled.add(key)
+        scheduler_wakeup.notify()
+
+
+def wait_for_transition():
+    # Blocks until a subscribed location's boundary is due; returns
+    # (location key, boundary)
+    with scheduler_wakeup:
+        while True:
+            if not transition_heap:
+                scheduler_wakeup.wait()
+                continue
+            boundary, key = transition_heap[0]
+            delay = boundary / 1000000 - time.time()
+            if delay > 0:
+                scheduler_wakeup.wait(delay)
+                continue
+            heapq.heappop(transition_heap)
+            scheduled.discard(key)
+            if subscribers.get(key):
+                last_fired[key] = boundary
+                return key, boundary
+
+
+def run_scheduler():
+    while True:
+        key, boundary = wait_for_transition()
+        place = places_by_key[key]
+        # Evaluate at the boundary itself so timer slop never reports the
+        # block that just ended. The event (which may run astral and rebuild
+        # the hour index) is built without holding the lock.
+        now = max(datetime.now(place["tz"]), (EPOCH + timedelta(microseconds=boundary)).astimezone(place["tz"]))
+        try:
+            event = sse_event(place, now)
+            following = next_boundary(place, now)
+        except Exception:
+            # One bad location must not take down every stream: log it and
+            # try that location again later
+            app.logger.exception("Transition event failed for %s/%s", *key)
+            with scheduler_wakeup:
+                schedule_transition(key, boundary + SSE_RETRY_SECONDS * 1000000)
+            continue
+        with scheduler_wakeup:
+            for q in subscribers.get(key, ()):
+                q.put(event)
+            schedule_transition(key, following)
+
+
+def subscribe(place):
+    global scheduler_thread
+    q = queue.SimpleQueue()
+    boundary = next_boundary(place, datetime.now(place["tz"]))
+    with scheduler_wakeup:
+        subscribers.setdefault(place["key"], set()).add(q)
+        schedule_transition(place["key"], boundary)
+        if scheduler_thread is None or not scheduler_thread.is_alive():
+            scheduler_thread = threading.Thread(target=run_scheduler, name="transition-scheduler", daemon=True)
+            scheduler_thread.start()
+    return q
+
+
+def unsubscribe(place, q):
+    with scheduler_wakeup:
+        queues = subscribers.get(place["key"])
+        if queues is not None:
+            queues.discard(q)
+            if not queues:
+                del subscribers[place["key"]]
+
+
+def stream_transitions(place):
+    # Subscribes on the first chunk, so a client that disconnects before the
+    # stream starts never leaves a queue behind
+    q = subscribe(place)
+    try:
+        yield sse_event(place, datetime.now(place["tz"]))
+        while True:
+            try:
+                yield q.get(timeout=SSE_KEEPALIVE_SECONDS)
+            except queue.Empty:
+                yield ": keepalive\n\n"
+    finally:
+        unsubscribe(place, q)
+
+
+@app.route('/events', methods=['GET'])
+def get_events():
+    requested_country = request.args.get("country")
+    requested_state = request.args.get("state")
+
+    place, error = resolve_place(requested_country, requested_state)
+    if error:
+        return error
+
+    return Response(stream_transitions(place), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+# ----- WARMUP -----
+# Pre-builds every per-location cache so the first request after startup
+# costs the same as any other. This is the only warm path: importing the
+# module stays cheap (export workers, CLI, bench.py), and serve.py and the
+# dev server run it before accepting connections.
+def warmup():
+    for place in all_places():
+        now = datetime.now(place["tz"])
+        roll_ephemeris(place, now.date())
+        find_current_hour(place, now)
+        with response_cache_lock:
+            response_cache[place["key"]] = build_response(place, now)
+
+
+# ----- BATCH ENGINE -----
+# Vectorized version of the hour-block math for many locations x many dates,
+# for almanacs and push schedules. Sunrise/sunset use the same NOAA formulas
+# astral does (two refinement passes, same zenith and refraction), evaluated
+# with NumPy over the whole (location, date) grid. Results agree with astral
+# to well under a second, except for events within a minute of 00:00 UTC
+# where astral solves on the wrong day and drifts by up to ~30 seconds.
+BATCH_TOLERANCE_SECONDS = 60
+BATCH_MAX_DAYS = 366
+
+# Planet index for each of the 24 hours (12 night, then 12 day) by
+# date.weekday(), mirroring the night-first order of /sun-times.
+HOUR_PLANETS = np.array([
+    [PLANETS.index(p) for p in nightHours[w] + dayHours[w]] for w in WEEKDAYS
+])
+
+SUNRISE_ZENITH = 90.0 + SUN_APPARENT_RADIUS + refraction_at_zenith(90.0 + SUN_APPARENT_RADIUS)
+UNIX_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+JULIAN_DAY_ORDINAL_OFFSET = 1721424.5
+
+
+def solar_terms(jc):
+    # Declination (degrees) and equation of time (minutes) for julian centuries jc
+    l0 = np.radians((280.46646 + jc * (36000.76983 + 0.0003032 * jc)) % 360.0)
+    m = np.radians(357.52911 + jc * (35999.05029 - 0.0001537 * jc))
+    e = 0.016708634 - jc * (0.000042037 + 0.0000001267 * jc)
+    c = (np.sin(m) * (1.914602 - jc * (0.004817 + 0.000014 * jc))
+         + np.sin(2 * m) * (0.019993 - 0.000101 * jc)
+         + np.sin(3 * m) * 0.000289)
+    omega = np.radians(125.04 - 1934.136 * jc)
+    apparent_long = np.radians(np.degrees(l0) + c - 0.00569 - 0.00478 * np.sin(omega))
+    seconds = 21.448 - jc * (46.815 + jc * (0.00059 - jc * 0.001813))
+    obliquity = np.radians(23.0 + (26.0 + seconds / 60.0) / 60.0 + 0.00256 * np.cos(omega))
+
+    declination = np.degrees(np.arcsin(np.sin(obliquity) * np.sin(apparent_long)))
+    y = np.tan(obliquity / 2.0) ** 2
+    eqtime = 4.0 * np.degrees(
+        y * np.sin(2 * l0)
+        - 2.0 * e * np.sin(m)
+        + 4.0 * e * y * np.sin(m) * np.cos(2 * l0)
+        - 0.5 * y * y * np.sin(4 * l0)
+        - 1.25 * e * e * np.sin(2 * m)
+    )
+    return declination, eqtime
+
+
+def transit_epoch(lat, lon, ordinals, rising):
+    # Epoch seconds of sunrise (rising=True) or sunset on the given UTC dates.
+    # lat/lon are (L, 1) arrays, ordinals is a (1, D) array of date ordinals.
+    lat = np.radians(np.clip(lat, -89.8, 89.8))
+    jd = ordinals + JULIAN_DAY_ORDINAL_OFFSET
+    adjustment = 0.0
+    for _ in range(2):
+        jc = (jd + adjustment - 2451545.0) / 36525.0
+        declination, eqtime = solar_terms(jc)
+        decl = np.radians(declination)
+        with np.errstate(invalid="ignore"):
+            hourangle = np.arccos(
+                (np.cos(np.radians(SUNRISE_ZENITH)) - np.sin(lat) * np.sin(decl))
+                / (np.cos(lat) * np.cos(decl))
+            )
+        if not rising:
+            hourangle = -hourangle
+        # Unlike astral, the offset is not wrapped into the UTC day: an event
+        # just before UTC midnight stays on the previous UTC day instead of
+        # jumping a day ahead, which is what makes astral give up on some
+        # Indian sunrises near 05:30 IST.
+        time_utc = 720.0 + (-lon - np.degrees(hourangle)) * 4.0 - eqtime
+        adjustment = time_utc / 1440.0
+    return (ordinals - UNIX_EPOCH_ORDINAL) * 86400.0 + time_utc * 60.0
+
+
+def local_transit_epoch(lat, lon, ordinals, utc_offsets, rising):
+    # Solve on the UTC date, and if the event lands on another local date
+    # retry with the neighbouring day.
+    events = transit_epoch(lat, lon, ordinals, rising)
+    local_ordinals = np.floor((events + utc_offsets) / 86400.0) + UNIX_EPOCH_ORDINAL
+    step = np.sign(ordinals - local_ordinals)
+    if np.any(step):
+        retried = transit_epoch(lat, lon, ordinals + step, rising)
+        events = np.where(step != 0, retried, events)
+    return events
+
+
+def utc_offsets(batch_places, dates):
+    # UTC offset in seconds at local noon, per (location, date)
+    return np.array([
+        [p["tz"].utcoffset(datetime(d.year, d.month, d.day, 12)).total_seconds() for d in dates]
+        for p in batch_places
+    ])
+
+
+def sun_events_batch(batch_places, dates):
+    # (sunrise, sunset) epoch-second arrays shaped (len(places), len(dates)).
+    # Where the sun never crosses the horizon the entries are NaN.
+    lat = np.array([[p["observer"].latitude] for p in batch_places], dtype=float)
+    lon = np.array([[p["observer"].longitude] for p in batch_places], dtype=float)
+    ordinals = np.array([[d.toordinal() for d in dates]], dtype=float)
+    offsets = utc_offsets(batch_places, dates)
+    sunrise = local_transit_epoch(lat, lon, ordinals, offsets, True)
+    sunset = local_transit_epoch(lat, lon, ordinals, offsets, False)
+    return sunrise, sunset
+
+
+def planetary_hours_batch(batch_places, start, days):
+    # All 24 unequal hours for each place and each date start .. start+days-1.
+    # Returns (starts, ends, planets) shaped (places, days, 24): epoch seconds
+    # and indices into PLANETS. Like /sun-times, hours 0-11 are the night
+    # before the date (previous sunset to sunrise) and 12-23 are its day.
+    dates = [start + timedelta(days=i) for i in range(-1, days)]
+    sunrise, sunset = sun_events_batch(batch_places, dates)
+
+    fractions = np.arange(12) / 12.0
+    night_start = sunset[:, :-1, None]
+    night_length = sunrise[:, 1:, None] - night_start
+    day_start = sunrise[:, 1:, None]
+    day_length = sunset[:, 1:, None] - day_start
+
+    starts = np.concatenate([night_start + fractions * night_length,
+                             day_start + fractions * day_length], axis=2)
+    ends = np.concatenate([night_start + (fractions + 1 / 12.0) * night_length,
+                           day_start + (fractions + 1 / 12.0) * day_length], axis=2)
+    weekdays = np.array([d.weekday() for d in dates[1:]])
+    planets = np.broadcast_to(HOUR_PLANETS[weekdays], starts.shape)
+    return starts, ends, planets
+
+
+def date_range_fits(start, days):
+    # The batch engine also reads the day before start, so the whole range
+    # start-1 .. start+days must be representable as dates
+    try:
+        start - timedelta(days=1)
+        start + timedelta(days=days)
+    except OverflowError:
+        return False
+    return True
+
+
+def epoch_seconds(values):
+    # Rounded epoch seconds as nested lists; None (JSON null) where the sun
+    # never crosses the horizon and the batch engine returned NaN
+    return [[int(v) if math.isfinite(v) else None for v in row] for row in np.rint(values).tolist()]
+
+
+def local_isoformat(epoch, tz):
+    return datetime.fromtimestamp(epoch, tz).isoformat(timespec="seconds") if math.isfinite(epoch) else None
+
+
+def parse_batch_request(data, max_days=None):
+    # Shared by /planetary-hours and /export: returns ((places, start, days), None)
+    # or (None, error response)
+    if not isinstance(data, dict):
+        return None, (jsonify({"error": "Request body must be a JSON object"}), 400)
+
+    requested = data.get("locations") or [{"country": p["country"], "state": p["state"]} for p in all_places()]
+    if not isinstance(requested, list) or not all(isinstance(r, dict) for r in requested):
+        return None, (jsonify({"error": "'locations' must be a list of {\"country\", \"state\"} objects"}), 400)
+
+    batch_places = []
+    for r in requested:
+        place, error = resolve_place(r.get("country"), r.get("state"))
+        if error:
+            return None, error
+        batch_places.append(place)
+
+    try:
+        start = date.fromisoformat(data["start"]) if data.get("start") else datetime.now(pytz.utc).date()
+    except (TypeError, ValueError) as e:
+        return None, (jsonify({"error": str(e)}), 400)
+    days = data.get("days", 1)
+    if isinstance(days, bool) or not isinstance(days, int):
+        return None, (jsonify({"error": "'days' must be an integer"}), 400)
+    if max_days and not 1 <= days <= max_days:
+        return None, (jsonify({"error": f"'days' must be between 1 and {max_days}"}), 400)
+    if days < 1:
+        return None, (jsonify({"error": "'days' must be at least 1"}), 400)
+    if not date_range_fits(start, days):
+        return None, (jsonify({"error": f"{days} days from {start.isoformat()} is outside the supported date range"}), 400)
+
+    return (batch_places, start, days), None
+
+
+@app.route('/planetary-hours', methods=['POST'])
+def get_planetary_hours():
+    parsed, error = parse_batch_request(request.json or {}, BATCH_MAX_DAYS)
+    if error:
+        return error
+    batch_places, start, days = parsed
+
+    try:
+        starts, ends, planets = planetary_hours_batch(batch_places, start, days)
+        dates = [(start + timedelta(days=i)).isoformat() for i in range(days)]
         return jsonify({
-            "date": now.strftime("%Y-%m-%d"),
-            "time": now.strftime("%H:%M:%S"),
-            "timezone": match["timezone"],
-            "hour_blocks": all_blocks,
-            "period": current_period,
-            "day_of_week": current_weekday,
-            "islamic_hour": current_islamic_hour
+            "start": start.isoformat(),
+            "days": days,
+            "planets": PLANETS,
+            "tolerance_seconds": BATCH_TOLERANCE_SECONDS,
+            "locations": [{
+                "country": p["country"],
+                "state": p["state"],
+                "timezone": p["timezone"],
+                "dates": dates,
+                "starts": epoch_seconds(starts[i]),
+                "ends": epoch_seconds(ends[i]),
+                "planets": planets[i].tolist()
+            } for i, p in enumerate(batch_places)]
         })
 
     except Exception as e:
@@ -139,6 +834,133 @@ def get_sun_times():
         return jsonify({"error": str(e)}), 500
 
 
+# ----- BULK EXPORT -----
+# Streams hour blocks for any set of locations and date range as NDJSON or
+# CSV. Work is cut into (location, EXPORT_CHUNK_DAYS) chunks rendered by a
+# process pool; at most EXPORT_IN_FLIGHT chunks per worker are pending at a
+# time, so memory stays flat however long the range is.
+EXPORT_CHUNK_DAYS = 31
+EXPORT_MAX_DAYS = 36600   # a century per request; the CLI has no limit
+EXPORT_IN_FLIGHT = 2
+EXPORT_FIELDS = ["country", "state", "date", "day_name", "period", "hour", "planet", "start", "end"]
+EXPORT_MIMETYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+export_pool = None
+export_workers = int(os.environ.get("EXPORT_WORKERS", 0)) or os.cpu_count()
+export_pool_lock = threading.Lock()
+
+
+def get_export_pool():
+    global export_pool
+    with export_pool_lock:
+        if export_pool is None:
+            # spawn, not fork: the parent is a threaded web server
+            export_pool = ProcessPoolExecutor(export_workers, mp_context=multiprocessing.get_context("spawn"))
+        return export_pool
+
+
+def export_rows(place, start, days):
+    # start/end are None (null in NDJSON, empty in CSV) on polar days
+    starts, ends, planets = planetary_hours_batch([place], start, days)
+    tz = place["tz"]
+    for d in range(days):
+        day = start + timedelta(days=d)
+        day_name = WEEKDAYS[day.weekday()]
+        for i in range(24):
+            yield {
+                "country": place["country"],
+                "state": place["state"],
+                "date": day.isoformat(),
+                "day_name": day_name,
+                "period": "Night" if i < 12 else "Day",
+                "hour": i % 12 + 1,
+                "planet": PLANETS[planets[0, d, i]],
+                "start": local_isoformat(starts[0, d, i], tz),
+                "end": local_isoformat(ends[0, d, i], tz)
+            }
+
+
+def render_export_chunk(job):
+    # Runs in a pool worker; returns the chunk already serialized
+    country, state, start_ordinal, days, fmt = job
+    rows = export_rows(find_place(country, state), date.fromordinal(start_ordinal), days)
+    if fmt == "csv":
+        out = io.StringIO()
+        csv.DictWriter(out, EXPORT_FIELDS).writerows(rows)
+        return out.getvalue()
+    return "".join(json.dumps(row) + "\n" for row in rows)
+
+
+def export_jobs(batch_places, start, days, fmt):
+    for place in batch_places:
+        for offset in range(0, days, EXPORT_CHUNK_DAYS):
+            yield (place["country"], place["state"], (start + timedelta(days=offset)).toordinal(),
+                   min(EXPORT_CHUNK_DAYS, days - offset), fmt)
+
+
+def stream_export(batch_places, start, days, fmt):
+    if fmt == "csv":
+        yield ",".join(EXPORT_FIELDS) + "\r\n"
+
+    pool = get_export_pool()
+    pending = deque()
+    for job in export_jobs(batch_places, start, days, fmt):
+        pending.append(pool.submit(render_export_chunk, job))
+        if len(pending) >= EXPORT_IN_FLIGHT * export_workers:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+@app.route('/export', methods=['POST'])
+def export_planetary_hours():
+    data = request.json or {}
+    parsed, error = parse_batch_request(data, EXPORT_MAX_DAYS)
+    if error:
+        return error
+    batch_places, start, days = parsed
+
+    fmt = data.get("format", "ndjson")
+    if not isinstance(fmt, str) or fmt not in EXPORT_MIMETYPES:
+        return jsonify({"error": f"Unknown format '{fmt}', expected one of {sorted(EXPORT_MIMETYPES)}"}), 400
+
+    return Response(stream_with_context(stream_export(batch_places, start, days, fmt)),
+                    mimetype=EXPORT_MIMETYPES[fmt])
+
+
+@app.cli.command("export")
+@click.option("--location", "locations", multiple=True, metavar="COUNTRY/STATE",
+              help="Location to export; repeatable. Defaults to every location in countries.json.")
+@click.option("--start", help="First date (YYYY-MM-DD). Defaults to today in UTC.")
+@click.option("--days", default=1, show_default=True, type=click.IntRange(min=1))
+@click.option("--format", "fmt", default="ndjson", show_default=True, type=click.Choice(sorted(EXPORT_MIMETYPES)))
+@click.option("--output", type=click.File("w", encoding="utf-8"), default="-")
+def export_command(locations, start, days, fmt, output):
+    """Export planetary hours as NDJSON or CSV."""
+    batch_places = []
+    for loc in locations:
+        country, _, state = loc.partition("/")
+        if not country.strip() or not state.strip():
+            raise click.BadParameter(f"'{loc}' is not of the form COUNTRY/STATE", param_hint="--location")
+        place = find_place(country, state)
+        if not place and normalize_name(country) not in country_names:
+            raise click.BadParameter(f"Country '{country}' not found", param_hint="--location")
+        if not place:
+            raise click.BadParameter(f"State/City '{state}' not found in {country}", param_hint="--location")
+        batch_places.append(place)
+    try:
+        start = date.fromisoformat(start) if start else datetime.now(pytz.utc).date()
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--start")
+    if not date_range_fits(start, days):
+        raise click.BadParameter(f"{days} days from {start.isoformat()} is outside the supported date range",
+                                 param_hint="--days")
+
+    for chunk in stream_export(batch_places or all_places(), start, days, fmt):
+        output.write(chunk)
+
+
 if __name__ == '__main__':
     port = int(os.environ.get("PORT", 5000))
+    warmup()
     app.run(host="0.0.0.0", port=port, debug=True)
@@ -0,0 +1,106 @@
+import argparse
+import json
+import statistics
+import time
+import tracemalloc
+
+import app as sun_app
+
+# Benchmark for /sun-times: drives the view through the Flask test client for
+# every location in countries.json and reports latency percentiles,
+# throughput and per-request memory.
+#
+#   python bench.py                 steady state (caches warm)
+#   python bench.py --cold          every request recomputes from scratch
+#   python bench.py --stages        also print the per-stage /metrics timers
+
+
+def clear_caches():
+    sun_app.response_cache.clear()
+    sun_app.ephemeris_cache.clear()
+    sun_app.ephemeris_today.clear()
+
+
+def requests_for(rounds):
+    bodies = [{"country": p["country"], "state": p["state"]} for p in sun_app.all_places()]
+    return bodies * rounds
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def run(client, bodies, cold):
+    latencies = []
+    for body in bodies:
+        if cold:
+            clear_caches()
+        start = time.perf_counter()
+        response = client.post("/sun-times", json=body)
+        latencies.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            raise SystemExit(f"{body} -> {response.status_code}: {response.get_data(as_text=True)}")
+    return latencies
+
+
+def measure_memory(client, bodies, cold):
+    # Peak extra memory held while serving one request, averaged
+    peaks = []
+    tracemalloc.start()
+    for body in bodies:
+        if cold:
+            clear_caches()
+        baseline, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        client.post("/sun-times", json=body)
+        _, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - baseline)
+    tracemalloc.stop()
+    return statistics.mean(peaks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark /sun-times across all locations.")
+    parser.add_argument("--rounds", type=int, default=50, help="passes over every location (default 50)")
+    parser.add_argument("--cold", action="store_true", help="clear all caches before each request")
+    parser.add_argument("--stages", action="store_true", help="enable per-stage timers and print /metrics")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    sun_app.METRICS_ENABLED = args.stages
+    client = sun_app.app.test_client()
+    bodies = requests_for(args.rounds)
+
+    run(client, requests_for(1), args.cold)  # warm imports and caches
+    sun_app.stage_seconds.clear()
+    sun_app.counters.clear()
+
+    started = time.perf_counter()
+    latencies = run(client, bodies, args.cold)
+    elapsed = time.perf_counter() - started
+    metrics = client.get("/metrics").get_data(as_text=True)  # before tracemalloc skews the timers
+    memory = measure_memory(client, requests_for(1), args.cold)
+
+    results = {
+        "mode": "cold" if args.cold else "warm",
+        "requests": len(latencies),
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "throughput_rps": len(latencies) / elapsed,
+        "peak_kib_per_request": memory / 1024,
+    }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for name, value in results.items():
+            print(f"{name:22} {value:.3f}" if isinstance(value, float) else f"{name:22} {value}")
+    if args.stages:
+        print()
+        print(metrics, end="")
+
+
+if __name__ == '__main__':
+    main()
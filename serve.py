@@ -0,0 +1,51 @@
+from gunicorn.app.base import BaseApplication
+import multiprocessing
+import os
+
+# Production entry point: python serve.py
+#
+# Pre-fork gunicorn master with gevent workers. Each worker is a single
+# process serving many connections cooperatively, which is what keeps
+# thousands of idle /events streams cheap. No debugger, no reloader.
+# gunicorn needs a POSIX host; on Windows use `python app.py` for development.
+#
+#   PORT               listen port (default 5000)
+#   WEB_CONCURRENCY    worker processes (default: one per CPU)
+#   WORKER_CONNECTIONS max concurrent connections per worker (default 10000)
+
+
+class ProductionServer(BaseApplication):
+    def __init__(self, options):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        # Imported here, after the gevent worker has monkey-patched the
+        # stdlib, so the app's locks and scheduler thread are cooperative.
+        from app import app
+        return app
+
+
+def post_worker_init(worker):
+    # Runs once the worker has loaded the app and before it accepts
+    # connections, so the first request hits warm caches.
+    from app import warmup
+    warmup()
+    worker.log.info("Worker %s warmed up", worker.pid)
+
+
+if __name__ == '__main__':
+    ProductionServer({
+        "bind": f"0.0.0.0:{int(os.environ.get('PORT', 5000))}",
+        "workers": int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count())),
+        "worker_class": "gevent",
+        "worker_connections": int(os.environ.get("WORKER_CONNECTIONS", 10000)),
+        "chdir": os.path.dirname(os.path.abspath(__file__)),
+        "post_worker_init": post_worker_init,
+        "preload_app": False,
+        "accesslog": "-",
+    }).run()
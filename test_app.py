@@ -0,0 +1,210 @@
+from datetime import date, datetime, timedelta
+
+from astral.sun import sunrise, sunset
+
+import app
+
+
+def astral_events(place, day):
+    try:
+        return (sunrise(place["observer"], day, place["tz"]).timestamp(),
+                sunset(place["observer"], day, place["tz"]).timestamp())
+    except ValueError:
+        return None
+
+
+def seconds_of_day(dt):
+    return dt.hour * 3600 + dt.minute * 60 + dt.second
+
+
+def test_batch_engine_matches_astral():
+    start = date(2026, 1, 1)
+    places = app.all_places()
+    starts, ends, _ = app.planetary_hours_batch(places, start, 365)
+    for i, place in enumerate(places):
+        for d in range(0, 365, 5):
+            events = astral_events(place, start + timedelta(days=d))
+            if events is None:
+                continue
+            assert abs(starts[i, d, 12] - events[0]) <= app.BATCH_TOLERANCE_SECONDS
+            assert abs(ends[i, d, 23] - events[1]) <= app.BATCH_TOLERANCE_SECONDS
+
+
+def test_sun_events_fall_back_when_astral_gives_up():
+    # astral raises for Delhi's 05:30 IST sunrise on 2026-05-17
+    place = app.find_place("India", "Delhi")
+    day = date(2026, 5, 17)
+    assert astral_events(place, day) is None
+
+    rise, set_ = app.get_sun_events(place, day)
+    assert rise.date() == day and set_.date() == day
+
+    # Sunrise moves well under a minute a day here, so the neighbouring
+    # days astral can solve bracket it within the stated tolerance.
+    before = sunrise(place["observer"], day - timedelta(days=1), place["tz"])
+    after = sunrise(place["observer"], day + timedelta(days=2), place["tz"])
+    low, high = sorted((seconds_of_day(before), seconds_of_day(after)))
+    assert low - app.BATCH_TOLERANCE_SECONDS <= seconds_of_day(rise) <= high + app.BATCH_TOLERANCE_SECONDS
+
+
+POLAR_COUNTRIES = [{
+    "country": "Norway",
+    "locations": [{"state": "Tromso", "latitude": 69.6492, "longitude": 18.9553, "timezone": "Europe/Oslo"}],
+}]
+
+
+def test_polar_day_is_null_not_garbage(monkeypatch):
+    places, country_names = app.build_registry(POLAR_COUNTRIES)
+    monkeypatch.setattr(app, "places", places)
+    monkeypatch.setattr(app, "country_names", country_names)
+    place = app.find_place("Norway", "Tromso")
+
+    body = app.app.test_client().post("/planetary-hours", json={
+        "locations": [{"country": "Norway", "state": "Tromso"}], "start": "2026-06-20", "days": 1,
+    }).get_json()
+    location = body["locations"][0]
+    assert location["starts"][0] == [None] * 24
+    assert location["ends"][0] == [None] * 24
+
+    rows = list(app.export_rows(place, date(2026, 6, 20), 1))
+    assert len(rows) == 24
+    assert all(row["start"] is None and row["end"] is None for row in rows)
+
+
+def pin_now(monkeypatch, naive):
+    # Freeze app's datetime.now at a local wall-clock time
+    class FrozenDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return tz.localize(naive) if tz else naive
+
+    monkeypatch.setattr(app, "datetime", FrozenDatetime)
+
+
+def reference_sun_times(place, now):
+    # The original per-block /sun-times implementation, kept as the oracle
+    # for the cached table + template serializer
+    observer, tz = place["observer"], place["tz"]
+    blocks = []
+    current = (None, None, None)
+    for offset in range(-3, 8):
+        day = now + timedelta(days=offset)
+        next_day = day + timedelta(days=1)
+        weekday = next_day.strftime("%A")
+        night_start = sunset(observer, day.date(), tz)
+        sunrise_ = sunrise(observer, next_day.date(), tz)
+        sunset_ = sunset(observer, next_day.date(), tz)
+        for period, start, end, planets in (("Night", night_start, sunrise_, app.nightHours[weekday]),
+                                            ("Day", sunrise_, sunset_, app.dayHours[weekday])):
+            length = (end - start).total_seconds() / 12
+            for i in range(12):
+                hour_start = start + timedelta(seconds=i * length)
+                hour_end = start + timedelta(seconds=(i + 1) * length)
+                is_current = start <= now < end and hour_start <= now < hour_end
+                blocks.append({
+                    "hour": i + 1,
+                    "start": hour_start.strftime("%H:%M"),
+                    "end": hour_end.strftime("%H:%M"),
+                    "planet": planets[i],
+                    "period": period,
+                    "date": next_day.strftime("%Y-%m-%d"),
+                    "day_name": weekday,
+                    "is_current": is_current
+                })
+                if is_current:
+                    current = (period, weekday, i + 1)
+    return {
+        "date": now.strftime("%Y-%m-%d"),
+        "time": now.strftime("%H:%M:%S"),
+        "timezone": place["timezone"],
+        "hour_blocks": blocks,
+        "period": current[0],
+        "day_of_week": current[1],
+        "islamic_hour": current[2]
+    }
+
+
+def assert_matches_reference(monkeypatch, client, place, naive):
+    pin_now(monkeypatch, naive)
+    body = {"country": place["country"], "state": place["state"]}
+    expected = reference_sun_times(place, place["tz"].localize(naive))
+    with app.app.app_context():
+        assert client.post("/sun-times", json=body).data == app.jsonify(expected).data
+
+    columnar = client.post("/sun-times?format=columnar", json=body).get_json()
+    current = [i for i, b in enumerate(expected["hour_blocks"]) if b["is_current"]]
+    assert columnar["current"] == (current[0] if current else None)
+    for field in ("period", "day_of_week", "islamic_hour", "time", "date"):
+        assert columnar[field] == expected[field]
+    return expected
+
+
+def test_sun_times_matches_per_block_rebuild(monkeypatch):
+    client = app.app.test_client()
+    for country, state, naive in [
+        ("UAE", "Dubai", datetime(2026, 10, 17, 9, 30)),
+        ("UAE", "Dubai", datetime(2026, 10, 17, 2, 10, 5)),
+        ("India", "Kerala", datetime(2026, 3, 1, 23, 59, 59)),
+        ("Trinidad and Tobago", "Port of Spain", datetime(2026, 12, 31, 18, 0)),
+        ("Indonesia", "Jakarta", datetime(2026, 7, 4, 12, 0)),
+    ]:
+        assert_matches_reference(monkeypatch, client, app.find_place(country, state), naive)
+
+
+def test_cached_sun_times_body_rolls_over_at_block_boundary(monkeypatch):
+    client = app.app.test_client()
+    place = app.find_place("Malaysia", "Penang")
+    tz = place["tz"]
+    naive = datetime(2026, 8, 9, 10, 0)
+    app.response_cache.clear()
+
+    # Fill the cache, then stay inside the same block (cache hit) and cross
+    # its end, where the cached body must not be reused
+    expected = assert_matches_reference(monkeypatch, client, place, naive)
+    i = next(i for i, b in enumerate(expected["hour_blocks"]) if b["is_current"])
+    period_start = sunrise(place["observer"], naive.date(), tz)
+    length = (sunset(place["observer"], naive.date(), tz) - period_start).total_seconds() / 12
+    block_end = (period_start + timedelta(seconds=(i % 12 + 1) * length)).replace(tzinfo=None)
+
+    for instant in (block_end - timedelta(seconds=1), block_end - timedelta(microseconds=1),
+                    block_end, block_end + timedelta(microseconds=1)):
+        assert_matches_reference(monkeypatch, client, place, instant)
+
+
+def test_current_hour_agrees_with_sun_times(monkeypatch):
+    client = app.app.test_client()
+    place = app.find_place("UAE", "Dubai")
+    tz = place["tz"]
+    query = {"country": place["country"], "state": place["state"]}
+    naive = datetime(2026, 10, 17, 14, 45)
+
+    pin_now(monkeypatch, naive)
+    sun_times = client.post("/sun-times", json=query).get_json()
+    current = client.get("/current-hour", query_string=query).get_json()
+    for field in ("period", "day_of_week", "islamic_hour"):
+        assert current[field] == sun_times[field]
+
+    # Exactly on the next boundary the following block is current, with the
+    # whole hour still to go
+    start = sunrise(place["observer"], naive.date(), tz)
+    length = (sunset(place["observer"], naive.date(), tz) - start).total_seconds() / 12
+    hour = current["islamic_hour"]
+    boundary = (start + timedelta(seconds=hour * length)).replace(tzinfo=None)
+
+    pin_now(monkeypatch, boundary)
+    expected = reference_sun_times(place, tz.localize(boundary))
+    k = next(i for i, b in enumerate(expected["hour_blocks"]) if b["is_current"])
+    block, following = expected["hour_blocks"][k], expected["hour_blocks"][k + 1]
+    current = client.get("/current-hour", query_string=query).get_json()
+
+    assert current["islamic_hour"] == hour + 1 == expected["islamic_hour"]
+    assert (current["period"], current["day_of_week"]) == (expected["period"], expected["day_of_week"])
+    assert (current["planet"], current["start"], current["end"]) == (block["planet"], block["start"], block["end"])
+    assert current["remaining_seconds"] == int(length)
+    assert current["next"] == {
+        "period": following["period"],
+        "day_of_week": following["day_name"],
+        "islamic_hour": following["hour"],
+        "planet": following["planet"],
+        "start": following["start"]
+    }